@@ -4,6 +4,7 @@ import pandas as pd
 import plotly.express as px
 from datetime import datetime, date, time
 import time as time_mod
+import threading
 from io import BytesIO
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
@@ -106,12 +107,103 @@ def to_time(s):
     except Exception:
         return None
 
-def pagina_gestion_pacientes():
-    st.header("👥 Gestión de Pacientes")
-    tabs = st.tabs(["➕ Crear", "📋 Listar", "✏️ Editar", "🗑️ Eliminar"])
+VIGENCIA_DATOS = 30
+
+@st.cache_resource
+def _version_compartida():
+    """Contador de versión de datos compartido por todas las sesiones."""
+    return {"valor": 0, "lock": threading.Lock()}
+
+def version_datos():
+    """Clave de los datos vigentes: la versión global, que avanza con cada alta,
+    edición o baja, y la ventana de `VIGENCIA_DATOS` segundos en curso."""
+    return (_version_compartida()["valor"], int(time_mod.time() // VIGENCIA_DATOS))
+
+def notificar(mensaje: str, tipo: str = "success"):
+    """Guarda un mensaje para mostrarlo tras el siguiente rerun completo."""
+    st.session_state.setdefault("notificaciones", []).append((tipo, mensaje))
+
+def mostrar_notificaciones():
+    for tipo, mensaje in st.session_state.pop("notificaciones", []):
+        getattr(st, tipo)(mensaje)
+
+def recargar_datos():
+    """Invalida las lecturas cacheadas y vuelve a ejecutar la página completa."""
+    n8n_cached.clear()
+    version = _version_compartida()
+    with version["lock"]:
+        version["valor"] += 1
+    st.rerun()
+
+# Estado derivado memoizado por versión de datos: el argumento `version` solo
+# forma parte de la clave de caché, y todas estas funciones leen de n8n a través
+# de `leer_datos` con esa misma clave. Etiquetas, mapas y filtros se recalculan
+# cuando cualquier sesión modifica datos desde la app o, para cambios hechos
+# fuera de ella, al empezar la siguiente ventana de 30 s.
+
+@st.cache_data(max_entries=8)
+def leer_datos(version, action: str, payload: dict):
+    return n8n_api(action, payload)
 
-    with tabs[0]:
-        st.subheader("Crear Paciente")
+@st.cache_data(max_entries=4)
+def opciones_pacientes(version):
+    pacientes = leer_datos(version, "listar_pacientes", {"busqueda": ""}) or []
+    return {f"{p['nombre']} ({p['email']})": p for p in pacientes}
+
+@st.cache_data(max_entries=4)
+def opciones_medicos(version):
+    medicos = leer_datos(version, "listar_medicos", {"busqueda": ""}) or []
+    return {f"{m['nombre']} ({m.get('especialidad','')})": m for m in medicos}
+
+@st.cache_data(max_entries=4)
+def etiquetas_citas(version):
+    citas = leer_datos(version, "listar_citas", {}) or []
+    labels = []
+    for c in citas:
+        med = c.get("medico_nombre") or c.get("medico") or ""
+        pac = c.get("paciente_nombre") or c.get("paciente") or ""
+        labels.append(f"[{c['id']}] {c.get('fecha_cita','')} {c.get('hora_cita','')} - {med} / {pac} ({c.get('estado','')})")
+    return citas, labels
+
+@st.cache_data(max_entries=4)
+def df_citas(version):
+    citas = leer_datos(version, "listar_citas", {}) or []
+    df = pd.DataFrame(citas)
+    if df.empty:
+        return df
+    if "medico_nombre" not in df.columns and "medico" in df.columns:
+        df["medico_nombre"] = df["medico"]
+    if "paciente_nombre" not in df.columns and "paciente" in df.columns:
+        df["paciente_nombre"] = df["paciente"]
+    if "especialidad" not in df.columns and "medico_especialidad" in df.columns:
+        df["especialidad"] = df["medico_especialidad"]
+    if "fecha_cita" in df.columns:
+        df["_fecha"] = pd.to_datetime(df["fecha_cita"], errors="coerce").dt.date
+    return df
+
+@st.cache_data(max_entries=32)
+def filtrar_citas(version, filtro_estado: str, filtro_medico: str, filtro_paciente: str, filtro_fecha):
+    """Devuelve las citas filtradas y ordenadas, o None si no hay citas."""
+    df = df_citas(version)
+    if df.empty:
+        return None
+    if filtro_estado != "Todos" and "estado" in df:
+        df = df[df["estado"] == filtro_estado]
+    if filtro_medico and "medico_nombre" in df:
+        df = df[df["medico_nombre"].fillna("").str.contains(filtro_medico, case=False)]
+    if filtro_paciente and "paciente_nombre" in df:
+        df = df[df["paciente_nombre"].fillna("").str.contains(filtro_paciente, case=False)]
+    if filtro_fecha is not None and "_fecha" in df:
+        df = df[df["_fecha"] == filtro_fecha]
+
+    cols = ["id","fecha_cita","hora_cita","estado","medico_nombre","especialidad","paciente_nombre"]
+    cols = [c for c in cols if c in df.columns]
+    return df[cols].sort_values(by=["fecha_cita","hora_cita"], ascending=True)
+
+@st.fragment
+def seccion_pacientes_crear():
+    st.subheader("Crear Paciente")
+    with st.form("pac_crear_form", border=False):
         col1, col2 = st.columns(2)
         with col1:
             nombre = st.text_input("Nombre*", key="pac_crear_nombre")
@@ -122,112 +214,130 @@ def pagina_gestion_pacientes():
             genero = st.selectbox("Género", ["", "Masculino", "Femenino"], key="pac_crear_genero")
             direccion = st.text_area("Dirección", key="pac_crear_dir")
             activo = st.checkbox("Activo", value=True, key="pac_crear_activo")
+        crear = st.form_submit_button("Crear Paciente", type="primary")
 
-        if st.button("Crear Paciente", type="primary"):
-            if not nombre or not email:
-                st.error("Nombre y Email son obligatorios.")
+    if crear:
+        if not nombre or not email:
+            st.error("Nombre y Email son obligatorios.")
+        else:
+            res = n8n_api("crear_paciente", {
+                "nombre": nombre,
+                "email": email,
+                "telefono": telefono,
+                "edad": int(edad) if edad else None,
+                "genero": genero or None,
+                "direccion": direccion or None,
+                "activo": bool(activo)
+            })
+            if res.get("success"):
+                notificar("✅ Paciente creado")
+                recargar_datos()
             else:
-                res = n8n_api("crear_paciente", {
-                    "nombre": nombre,
-                    "email": email,
-                    "telefono": telefono,
-                    "edad": int(edad) if edad else None,
-                    "genero": genero or None,
-                    "direccion": direccion or None,
-                    "activo": bool(activo)
-                })
-                if res.get("success"):
-                    st.success("✅ Paciente creado")
-                    st.cache_data.clear()
-                else:
-                    st.error("❌ No se pudo crear el paciente")
-            st.rerun()
+                st.error("❌ No se pudo crear el paciente")
 
-    with tabs[1]:
-        st.subheader("Lista de Pacientes")
+@st.fragment
+def seccion_pacientes_listar():
+    st.subheader("Lista de Pacientes")
+    with st.form("pac_list_form", border=False):
         colf1, colf2 = st.columns([2,1])
         with colf1:
             busq = st.text_input("Buscar por nombre", key="pac_list_busq")
         with colf2:
-            do_search = st.button("🔍 Buscar", use_container_width=True)
-
-        if do_search or busq == "":
-            pacientes = n8n_cached("listar_pacientes", {"busqueda": busq})
-        else:
-            pacientes = []
+            do_search = st.form_submit_button("🔍 Buscar", use_container_width=True)
+
+    if do_search or busq == "":
+        pacientes = n8n_cached("listar_pacientes", {"busqueda": busq})
+    else:
+        pacientes = []
+
+    if not pacientes:
+        st.info("No se encontraron pacientes.")
+    else:
+        df = pd.DataFrame(pacientes)
+        cols = ["id", "nombre", "email", "telefono", "edad", "genero", "direccion", "fecha_registro", "activo"]
+        cols = [c for c in cols if c in df.columns]
+        st.dataframe(df[cols], use_container_width=True, hide_index=True)
+
+@st.fragment
+def seccion_pacientes_editar():
+    st.subheader("Editar Paciente")
+    opciones = opciones_pacientes(version_datos())
+    if not opciones:
+        st.info("No hay pacientes.")
+        return
 
-        if not pacientes:
-            st.info("No se encontraron pacientes.")
-        else:
-            df = pd.DataFrame(pacientes)
-            cols = ["id", "nombre", "email", "telefono", "edad", "genero", "direccion", "fecha_registro", "activo"]
-            cols = [c for c in cols if c in df.columns]
-            st.dataframe(df[cols], use_container_width=True, hide_index=True)
+    key_sel = st.selectbox("Seleccionar paciente", list(opciones.keys()))
+    sel = opciones[key_sel]
 
-    with tabs[2]:
-        st.subheader("Editar Paciente")
-        pacientes = n8n_cached("listar_pacientes", {"busqueda": ""}) or []
-        if not pacientes:
-            st.info("No hay pacientes.")
+    with st.form("pac_edit_form", border=False):
+        col1, col2 = st.columns(2)
+        with col1:
+            nuevo_nombre = st.text_input("Nombre", value=sel.get("nombre",""))
+            nuevo_email = st.text_input("Email", value=sel.get("email",""))
+            nuevo_tel = st.text_input("Teléfono", value=sel.get("telefono","") or "")
+            nueva_edad = st.number_input("Edad", value=int(sel.get("edad") or 0), min_value=0, max_value=120)
+        with col2:
+            nuevo_genero = st.selectbox("Género",
+                                        ["", "Masculino", "Femenino"],
+                                        index=["","Masculino","Femenino"].index(sel.get("genero","") or ""))
+            nueva_dir = st.text_area("Dirección", value=sel.get("direccion","") or "")
+            nuevo_activo = st.checkbox("Activo", value=bool(sel.get("activo", True)))
+        guardar = st.form_submit_button("Guardar cambios", type="primary")
+
+    if guardar:
+        res = n8n_api("editar_paciente", {
+            "paciente_id": sel["id"],
+            "nombre": nuevo_nombre,
+            "email": nuevo_email,
+            "telefono": nuevo_tel,
+            "edad": int(nueva_edad) if nueva_edad else None,
+            "genero": nuevo_genero or None,
+            "direccion": nueva_dir or None,
+            "activo": bool(nuevo_activo)
+        })
+        if res.get("success"):
+            notificar("✅ Paciente actualizado")
+            recargar_datos()
         else:
-            opciones = {f"{p['nombre']} ({p['email']})": p for p in pacientes}
-            key_sel = st.selectbox("Seleccionar paciente", list(opciones.keys()))
-            sel = opciones[key_sel]
-
-            col1, col2 = st.columns(2)
-            with col1:
-                nuevo_nombre = st.text_input("Nombre", value=sel.get("nombre",""))
-                nuevo_email = st.text_input("Email", value=sel.get("email",""))
-                nuevo_tel = st.text_input("Teléfono", value=sel.get("telefono","") or "")
-                nueva_edad = st.number_input("Edad", value=int(sel.get("edad") or 0), min_value=0, max_value=120)
-            with col2:
-                nuevo_genero = st.selectbox("Género",
-                                            ["", "Masculino", "Femenino"],
-                                            index=["","Masculino","Femenino"].index(sel.get("genero","") or ""))
-                nueva_dir = st.text_area("Dirección", value=sel.get("direccion","") or "")
-                nuevo_activo = st.checkbox("Activo", value=bool(sel.get("activo", True)))
-
-            if st.button("Guardar cambios", type="primary"):
-                res = n8n_api("editar_paciente", {
-                    "paciente_id": sel["id"],
-                    "nombre": nuevo_nombre,
-                    "email": nuevo_email,
-                    "telefono": nuevo_tel,
-                    "edad": int(nueva_edad) if nueva_edad else None,
-                    "genero": nuevo_genero or None,
-                    "direccion": nueva_dir or None,
-                    "activo": bool(nuevo_activo)
-                })
-                if res.get("success"):
-                    st.success("✅ Paciente actualizado")
-                    st.cache_data.clear()
-                else:
-                    st.error("❌ No se pudo actualizar el paciente")
+            st.error("❌ No se pudo actualizar el paciente")
+
+@st.fragment
+def seccion_pacientes_eliminar():
+    st.subheader("Eliminar Paciente")
+    opciones = opciones_pacientes(version_datos())
+    if not opciones:
+        st.info("No hay pacientes.")
+        return
 
-    with tabs[3]:
-        st.subheader("Eliminar Paciente")
-        pacientes = n8n_cached("listar_pacientes", {"busqueda": ""}) or []
-        if not pacientes:
-            st.info("No hay pacientes.")
+    key_sel = st.selectbox("Seleccionar paciente a eliminar", list(opciones.keys()), key="pac_del_sel")
+    sel = opciones[key_sel]
+    st.warning("Esta acción no se puede deshacer.")
+    if st.button("Eliminar Paciente", type="secondary"):
+        res = n8n_api("eliminar_paciente", {"paciente_id": sel["id"]})
+        if res.get("success"):
+            notificar("🗑️ Paciente eliminado")
+            recargar_datos()
         else:
-            opciones = {f"{p['nombre']} ({p['email']})": p for p in pacientes}
-            key_sel = st.selectbox("Seleccionar paciente a eliminar", list(opciones.keys()), key="pac_del_sel")
-            sel = opciones[key_sel]
-            st.warning("Esta acción no se puede deshacer.")
-            if st.button("Eliminar Paciente", type="secondary"):
-                res = n8n_api("eliminar_paciente", {"paciente_id": sel["id"]})
-                if res.get("success"):
-                    st.success("🗑️ Paciente eliminado")
-                    st.cache_data.clear()
-                else:
-                    st.error("❌ No se pudo eliminar el paciente")
+            st.error("❌ No se pudo eliminar el paciente")
 
-def pagina_gestion_medicos():
-    st.header("👨‍⚕️ Gestión de Médicos")
+def pagina_gestion_pacientes():
+    st.header("👥 Gestión de Pacientes")
+    mostrar_notificaciones()
     tabs = st.tabs(["➕ Crear", "📋 Listar", "✏️ Editar", "🗑️ Eliminar"])
 
     with tabs[0]:
-        st.subheader("Crear Médico")
+        seccion_pacientes_crear()
+    with tabs[1]:
+        seccion_pacientes_listar()
+    with tabs[2]:
+        seccion_pacientes_editar()
+    with tabs[3]:
+        seccion_pacientes_eliminar()
+
+@st.fragment
+def seccion_medicos_crear():
+    st.subheader("Crear Médico")
+    with st.form("med_crear_form", border=False):
         col1, col2 = st.columns(2)
         with col1:
             nombre = st.text_input("Nombre*", key="med_crear_nombre")
@@ -236,332 +346,372 @@ def pagina_gestion_medicos():
         with col2:
             telefono = st.text_input("Teléfono", key="med_crear_tel")
             activo = st.checkbox("Activo", value=True, key="med_crear_activo")
+        crear = st.form_submit_button("Crear Médico", type="primary")
 
-        if st.button("Crear Médico", type="primary"):
-            if not nombre or not especialidad:
-                st.error("Nombre y Especialidad son obligatorios.")
+    if crear:
+        if not nombre or not especialidad:
+            st.error("Nombre y Especialidad son obligatorios.")
+        else:
+            res = n8n_api("crear_medico", {
+                "nombre": nombre, "especialidad": especialidad,
+                "email": email or None, "telefono": telefono or None,
+                "activo": bool(activo)
+            })
+            if res.get("success"):
+                notificar("✅ Médico creado")
+                recargar_datos()
             else:
-                res = n8n_api("crear_medico", {
-                    "nombre": nombre, "especialidad": especialidad,
-                    "email": email or None, "telefono": telefono or None,
-                    "activo": bool(activo)
-                })
-                if res.get("success"):
-                    st.success("✅ Médico creado")
-                    st.cache_data.clear()
-                else:
-                    st.error("❌ No se pudo crear el médico")
+                st.error("❌ No se pudo crear el médico")
 
-    with tabs[1]:
-        st.subheader("Lista de Médicos")
+@st.fragment
+def seccion_medicos_listar():
+    st.subheader("Lista de Médicos")
+    with st.form("med_list_form", border=False):
         col1, col2 = st.columns([3,1])
         with col1:
             busq = st.text_input("Buscar por nombre/especialidad", key="med_list_busq")
         with col2:
-            do_search = st.button("🔍 Buscar", use_container_width=True)
+            do_search = st.form_submit_button("🔍 Buscar", use_container_width=True)
+
+    if do_search or busq == "":
+        medicos = n8n_cached("listar_medicos", {"busqueda": busq})
+    else:
+        medicos = []
+
+    if not medicos:
+        st.info("No se encontraron médicos.")
+    else:
+        df = pd.DataFrame(medicos)
+        cols = ["id","nombre","especialidad","email","telefono","activo"]
+        cols = [c for c in cols if c in df.columns]
+        st.dataframe(df[cols], use_container_width=True, hide_index=True)
+
+@st.fragment
+def seccion_medicos_editar():
+    st.subheader("Editar Médico")
+    opciones = opciones_medicos(version_datos())
+    if not opciones:
+        st.info("No hay médicos.")
+        return
 
-        if do_search or busq == "":
-            medicos = n8n_cached("listar_medicos", {"busqueda": busq})
-        else:
-            medicos = []
+    key_sel = st.selectbox("Seleccionar médico", list(opciones.keys()), key="med_edit_sel")
+    sel = opciones[key_sel]
 
-        if not medicos:
-            st.info("No se encontraron médicos.")
+    with st.form("med_edit_form", border=False):
+        col1, col2 = st.columns(2)
+        with col1:
+            nuevo_nombre = st.text_input("Nombre", value=sel.get("nombre",""))
+            nueva_especialidad = st.text_input("Especialidad", value=sel.get("especialidad",""))
+            nuevo_email = st.text_input("Email", value=sel.get("email","") or "")
+        with col2:
+            nuevo_tel = st.text_input("Teléfono", value=sel.get("telefono","") or "")
+            nuevo_activo = st.checkbox("Activo", value=bool(sel.get("activo", True)))
+        guardar = st.form_submit_button("Guardar cambios", type="primary")
+
+    if guardar:
+        res = n8n_api("editar_medico", {
+            "medico_id": sel["id"],
+            "nombre": nuevo_nombre,
+            "especialidad": nueva_especialidad,
+            "email": nuevo_email or None,
+            "telefono": nuevo_tel or None,
+            "activo": bool(nuevo_activo)
+        })
+        if res.get("success"):
+            notificar("✅ Médico actualizado")
+            recargar_datos()
         else:
-            df = pd.DataFrame(medicos)
-            cols = ["id","nombre","especialidad","email","telefono","activo"]
-            cols = [c for c in cols if c in df.columns]
-            st.dataframe(df[cols], use_container_width=True, hide_index=True)
+            st.error("❌ No se pudo actualizar el médico")
+
+@st.fragment
+def seccion_medicos_eliminar():
+    st.subheader("Eliminar Médico")
+    opciones = opciones_medicos(version_datos())
+    if not opciones:
+        st.info("No hay médicos.")
+        return
 
-    with tabs[2]:
-        st.subheader("Editar Médico")
-        medicos = n8n_cached("listar_medicos", {"busqueda": ""}) or []
-        if not medicos:
-            st.info("No hay médicos.")
+    key_sel = st.selectbox("Seleccionar médico a eliminar", list(opciones.keys()), key="med_del_sel")
+    sel = opciones[key_sel]
+    st.warning("Esta acción no se puede deshacer.")
+    if st.button("Eliminar Médico", type="secondary"):
+        res = n8n_api("eliminar_medico", {"medico_id": sel["id"]})
+        if res.get("success"):
+            notificar("🗑️ Médico eliminado")
+            recargar_datos()
         else:
-            opciones = {f"{m['nombre']} ({m.get('especialidad','')})": m for m in medicos}
-            key_sel = st.selectbox("Seleccionar médico", list(opciones.keys()), key="med_edit_sel")
-            sel = opciones[key_sel]
-
-            col1, col2 = st.columns(2)
-            with col1:
-                nuevo_nombre = st.text_input("Nombre", value=sel.get("nombre",""))
-                nueva_especialidad = st.text_input("Especialidad", value=sel.get("especialidad",""))
-                nuevo_email = st.text_input("Email", value=sel.get("email","") or "")
-            with col2:
-                nuevo_tel = st.text_input("Teléfono", value=sel.get("telefono","") or "")
-                nuevo_activo = st.checkbox("Activo", value=bool(sel.get("activo", True)))
-
-            if st.button("Guardar cambios", type="primary"):
-                res = n8n_api("editar_medico", {
-                    "medico_id": sel["id"],
-                    "nombre": nuevo_nombre,
-                    "especialidad": nueva_especialidad,
-                    "email": nuevo_email or None,
-                    "telefono": nuevo_tel or None,
-                    "activo": bool(nuevo_activo)
-                })
-                if res.get("success"):
-                    st.success("✅ Médico actualizado")
-                    st.cache_data.clear()
-                else:
-                    st.error("❌ No se pudo actualizar el médico")
+            st.error("❌ No se pudo eliminar el médico")
+
+def pagina_gestion_medicos():
+    st.header("👨‍⚕️ Gestión de Médicos")
+    mostrar_notificaciones()
+    tabs = st.tabs(["➕ Crear", "📋 Listar", "✏️ Editar", "🗑️ Eliminar"])
 
+    with tabs[0]:
+        seccion_medicos_crear()
+    with tabs[1]:
+        seccion_medicos_listar()
+    with tabs[2]:
+        seccion_medicos_editar()
     with tabs[3]:
-        st.subheader("Eliminar Médico")
-        medicos = n8n_cached("listar_medicos", {"busqueda": ""}) or []
-        if not medicos:
-            st.info("No hay médicos.")
-        else:
-            opciones = {f"{m['nombre']} ({m.get('especialidad','')})": m for m in medicos}
-            key_sel = st.selectbox("Seleccionar médico a eliminar", list(opciones.keys()), key="med_del_sel")
-            sel = opciones[key_sel]
-            st.warning("Esta acción no se puede deshacer.")
-            if st.button("Eliminar Médico", type="secondary"):
-                res = n8n_api("eliminar_medico", {"medico_id": sel["id"]})
-                if res.get("success"):
-                    st.success("🗑️ Médico eliminado")
-                    st.cache_data.clear()
-                else:
-                    st.error("❌ No se pudo eliminar el médico")
+        seccion_medicos_eliminar()
 
 
-def pagina_gestion_citas():
-    st.header("📅 Gestión de Citas")
-    tabs = st.tabs(["➕ Crear", "📋 Listar", "✏️ Editar", "🗑️ Eliminar"])
+def _reset_verificacion():
+    st.session_state.pop("cita_verificada", None)
+    st.session_state.pop("cita_firma", None)
+    st.session_state.pop("cita_verif_msg", None)
 
-    medicos = n8n_cached("listar_medicos", {"busqueda": ""}) or []
-    pacientes = n8n_cached("listar_pacientes", {"busqueda": ""}) or []
-    map_medico = {f"{m['nombre']} ({m.get('especialidad','')})": m for m in medicos}
-    map_paciente = {f"{p['nombre']} ({p['email']})": p for p in pacientes}
+def _firma_cita(med_id, fecha_cita, hora_cita):
+    return (
+        med_id,
+        fecha_cita.strftime("%Y-%m-%d") if fecha_cita else None,
+        hora_cita.strftime("%H:%M") if hora_cita else None
+    )
 
-    def _reset_verificacion():
-        st.session_state.pop("cita_verificada", None)
-        st.session_state.pop("cita_firma", None)
+def _medico_id(map_medico, sel_med):
+    return map_medico[sel_med]["id"] if sel_med in map_medico else None
+
+def _verificar_disponibilidad():
+    """Callback del botón de verificación: lee la selección vigente desde
+    session_state y deja el resultado ahí para que el fragmento lo pinte sin
+    necesidad de un rerun adicional."""
+    map_medico = opciones_medicos(version_datos())
+    sel_med = st.session_state.get("cita_crear_med") or ""
+    sel_pac = st.session_state.get("cita_crear_pac") or ""
+    fecha_cita = st.session_state.get("cita_crear_fecha")
+    hora_cita = st.session_state.get("cita_crear_hora")
+    med_id = _medico_id(map_medico, sel_med)
+    es_domingo = fecha_cita.weekday() == 6 if fecha_cita else False
+    firma = _firma_cita(med_id, fecha_cita, hora_cita)
+
+    if med_id is None or "-- No hay" in sel_pac:
+        st.session_state["cita_verif_msg"] = ("error", "Debes registrar al menos un médico y un paciente.", firma)
+    elif es_domingo:
+        st.session_state["cita_verif_msg"] = ("error", "🚫 No se pueden agendar citas los domingos.", firma)
+    else:
+        disp = n8n_api("verificar_disponibilidad", {
+            "fecha_cita": fecha_cita.strftime("%Y-%m-%d"),
+            "hora_cita": hora_cita.strftime("%H:%M:%S"),
+            "medico_id": med_id
+        })
+        if disp.get("disponible") == "true":
+            st.session_state["cita_verificada"] = True
+            st.session_state["cita_firma"] = firma
+            st.session_state["cita_verif_msg"] = ("success", "✅ Horario disponible. Ahora puedes crear la cita.", firma)
+        else:
+            st.session_state["cita_verificada"] = False
+            st.session_state["cita_firma"] = None
+            st.session_state.pop("cita_timer_start", None)
+            st.session_state["cita_verif_msg"] = ("error", "❌ No disponible. Elige otra hora.", firma)
 
-    with tabs[0]:
-        st.subheader("Crear Cita")
+@st.fragment
+def seccion_citas_crear():
+    st.subheader("Crear Cita")
+    version = version_datos()
+    map_medico = opciones_medicos(version)
+    map_paciente = opciones_pacientes(version)
 
-        st.session_state.setdefault("cita_verificada", False)
-        st.session_state.setdefault("cita_firma", None)
-        st.session_state.setdefault("cita_timer_start", None)
+    st.session_state.setdefault("cita_verificada", False)
+    st.session_state.setdefault("cita_firma", None)
+    st.session_state.setdefault("cita_timer_start", None)
 
-        if st.session_state.get("cita_timer_start") is None:
-            st.session_state["cita_timer_start"] = time_mod.time()
+    if st.session_state.get("cita_timer_start") is None:
+        st.session_state["cita_timer_start"] = time_mod.time()
 
-        col1, col2 = st.columns(2)
-        with col1:
-            sel_med = st.selectbox(
-                "Médico*", list(map_medico.keys()) or ["-- No hay médicos --"],
-                key="cita_crear_med", on_change=_reset_verificacion
-            )
-            sel_pac = st.selectbox(
-                "Paciente*", list(map_paciente.keys()) or ["-- No hay pacientes --"],
-                key="cita_crear_pac"
-            )
-            fecha_cita = st.date_input(
-                "Fecha*", min_value=date.today(),
-                key="cita_crear_fecha", on_change=_reset_verificacion
-            )
-        with col2:
-            hora_cita = st.time_input(
-                "Hora*", value=time(9,0),
-                key="cita_crear_hora", on_change=_reset_verificacion
-            )
-            estado = st.selectbox("Estado", ESTADOS_VALIDOS, index=0, key="cita_crear_estado")
+    col1, col2 = st.columns(2)
+    with col1:
+        sel_med = st.selectbox(
+            "Médico*", list(map_medico.keys()) or ["-- No hay médicos --"],
+            key="cita_crear_med", on_change=_reset_verificacion
+        )
+        sel_pac = st.selectbox(
+            "Paciente*", list(map_paciente.keys()) or ["-- No hay pacientes --"],
+            key="cita_crear_pac"
+        )
+        fecha_cita = st.date_input(
+            "Fecha*", min_value=date.today(),
+            key="cita_crear_fecha", on_change=_reset_verificacion
+        )
+    with col2:
+        hora_cita = st.time_input(
+            "Hora*", value=time(9,0),
+            key="cita_crear_hora", on_change=_reset_verificacion
+        )
+        estado = st.selectbox("Estado", ESTADOS_VALIDOS, index=0, key="cita_crear_estado")
 
-        es_domingo = fecha_cita.weekday() == 6 if fecha_cita else False
-        if es_domingo:
-            st.error("🚫 No se pueden agendar citas los domingos.")
+    es_domingo = fecha_cita.weekday() == 6 if fecha_cita else False
+    if es_domingo:
+        st.error("🚫 No se pueden agendar citas los domingos.")
 
-        med_id = map_medico[sel_med]["id"] if "-- No hay" not in sel_med else None
-        firma_actual = (
-            med_id,
-            fecha_cita.strftime("%Y-%m-%d") if fecha_cita else None,
-            hora_cita.strftime("%H:%M")
-        )
+    med_id = _medico_id(map_medico, sel_med)
+    firma_actual = _firma_cita(med_id, fecha_cita, hora_cita)
 
-        colb1, colb2 = st.columns(2)
-        with colb1:
-            verificar = st.button("🔍 Verificar Disponibilidad", use_container_width=True)
-        with colb2:
-            crear = st.button(
-                "🩺 Crear Cita",
-                type="primary",
-                use_container_width=True,
-                disabled=(
-                    es_domingo or
-                    med_id is None or
-                    "-- No hay" in sel_pac or
-                    not st.session_state.get("cita_verificada", False) or
-                    st.session_state.get("cita_firma") != firma_actual
-                )
+    colb1, colb2 = st.columns(2)
+    with colb1:
+        st.button(
+            "🔍 Verificar Disponibilidad", use_container_width=True,
+            on_click=_verificar_disponibilidad
+        )
+    with colb2:
+        crear = st.button(
+            "🩺 Crear Cita",
+            type="primary",
+            use_container_width=True,
+            disabled=(
+                es_domingo or
+                med_id is None or
+                "-- No hay" in sel_pac or
+                not st.session_state.get("cita_verificada", False) or
+                st.session_state.get("cita_firma") != firma_actual
             )
+        )
 
-        if verificar:
-            if med_id is None or "-- No hay" in sel_pac:
-                st.error("Debes registrar al menos un médico y un paciente.")
-            elif es_domingo:
-                st.error("🚫 No se pueden agendar citas los domingos.")
-            else:
-                disp = n8n_api("verificar_disponibilidad", {
-                    "fecha_cita": fecha_cita.strftime("%Y-%m-%d"),
-                    "hora_cita": hora_cita.strftime("%H:%M:%S"),
-                    "medico_id": med_id
-                })
-                if disp.get("disponible") == "true":
-                    st.success("✅ Horario disponible. Ahora puedes crear la cita.")
-                    st.session_state["cita_verificada"] = True
-                    st.session_state["cita_firma"] = firma_actual
-                else:
-                    st.session_state["cita_verificada"] = False
-                    st.session_state["cita_firma"] = None
-                    st.session_state.pop("cita_timer_start", None)
-                    st.error("❌ No disponible. Elige otra hora.")
-                
-                st.rerun()
-
-        if crear:
-            if es_domingo:
-                st.error("🚫 No se pueden agendar citas los domingos.")
-            elif not st.session_state.get("cita_verificada", False) or st.session_state.get("cita_firma") != firma_actual:
-                st.warning("Primero verifica la disponibilidad del horario seleccionado.")
-            elif med_id is None or "-- No hay" in sel_pac:
-                st.error("Debes registrar al menos un médico y un paciente.")
-            else:
-                pac_id = map_paciente[sel_pac]["id"]
-                timer_start = st.session_state.get("cita_timer_start")
-                tiempo_segundos = None
-                if timer_start:
-                    tiempo_segundos = round(time_mod.time() - timer_start, 2)
-
-                payload_crear = {
-                    "medico_id": med_id,
-                    "paciente_id": pac_id,
-                    "fecha_cita": fecha_cita.strftime("%Y-%m-%d"),
-                    "hora_cita": hora_cita.strftime("%H:%M:%S"),
-                    "estado": estado,
-                    "tiempo_segundos_creacion": tiempo_segundos
-                }
-
-                res = n8n_api("crear_cita", payload_crear)
-                if res.get("success"):
-                    st.success("✅ Cita creada")
-                    st.cache_data.clear()
-                    if tiempo_segundos is not None:
-                        st.info(f"⏱️ Tiempo desde la verificación hasta la creación: {tiempo_segundos} segundos")
-                    else:
-                        st.info("⏱️ Tiempo de creación: no disponible")
-                    _reset_verificacion()
-                else:
-                    st.error("❌ No se pudo crear la cita")
-
-        if st.session_state.get("cita_firma") and st.session_state.get("cita_firma") != firma_actual:
-            st.info("ℹ️ Cambiaste médico/fecha/hora. Vuelve a verificar disponibilidad.")
-
-        with tabs[1]:
-            st.subheader("Lista de Citas")
-            colf1, colf2, colf3, colf4 = st.columns(4)
-            with colf1:
-                filtro_estado = st.selectbox("Estado", ["Todos"] + ESTADOS_VALIDOS, index=0, key="citas_list_filtro_estado")
-            with colf2:
-                filtro_medico = st.text_input("Doctor contiene...")
-            with colf3:
-                filtro_paciente = st.text_input("Paciente contiene...")
-            with colf4:
-                filtro_fecha = st.date_input("Fecha (opcional)", value=None)
-
-            citas = n8n_cached("listar_citas", {}) or []
-            df = pd.DataFrame(citas)
-            if not df.empty:
-                if "medico_nombre" not in df.columns and "medico" in df.columns:
-                    df["medico_nombre"] = df["medico"]
-                if "paciente_nombre" not in df.columns and "paciente" in df.columns:
-                    df["paciente_nombre"] = df["paciente"]
-                if "especialidad" not in df.columns and "medico_especialidad" in df.columns:
-                    df["especialidad"] = df["medico_especialidad"]
-
-                if filtro_estado != "Todos" and "estado" in df:
-                    df = df[df["estado"] == filtro_estado]
-                if filtro_medico and "medico_nombre" in df:
-                    df = df[df["medico_nombre"].fillna("").str.contains(filtro_medico, case=False)]
-                if filtro_paciente and "paciente_nombre" in df:
-                    df = df[df["paciente_nombre"].fillna("").str.contains(filtro_paciente, case=False)]
-                if filtro_fecha is not None and "fecha_cita" in df:
-                    df = df[pd.to_datetime(df["fecha_cita"]).dt.date == filtro_fecha]
-
-                cols = ["id","fecha_cita","hora_cita","estado","medico_nombre","especialidad","paciente_nombre"]
-                cols = [c for c in cols if c in df.columns]
-                st.dataframe(df[cols].sort_values(by=["fecha_cita","hora_cita"], ascending=True),
-                            use_container_width=True, hide_index=True)
-            else:
-                st.info("No hay citas.")
+    # El resultado de la verificación solo vale para la selección que se verificó.
+    verif_msg = st.session_state.get("cita_verif_msg")
+    if verif_msg and verif_msg[2] == firma_actual:
+        getattr(st, verif_msg[0])(verif_msg[1])
+    elif verif_msg:
+        st.session_state.pop("cita_verif_msg", None)
 
-    with tabs[2]:
-        st.subheader("Editar Cita")
-        citas = n8n_cached("listar_citas", {}) or []
-        if not citas:
-            st.info("No hay citas para editar.")
+    if crear:
+        if es_domingo:
+            st.error("🚫 No se pueden agendar citas los domingos.")
+        elif not st.session_state.get("cita_verificada", False) or st.session_state.get("cita_firma") != firma_actual:
+            st.warning("Primero verifica la disponibilidad del horario seleccionado.")
+        elif med_id is None or "-- No hay" in sel_pac:
+            st.error("Debes registrar al menos un médico y un paciente.")
         else:
-            labels = []
-            for c in citas:
-                med = c.get("medico_nombre") or c.get("medico") or ""
-                pac = c.get("paciente_nombre") or c.get("paciente") or ""
-                labels.append(f"[{c['id']}] {c.get('fecha_cita','')} {c.get('hora_cita','')} - {med} / {pac} ({c.get('estado','')})")
-            idx = st.selectbox("Selecciona la cita", list(range(len(citas))), format_func=lambda i: labels[i])
-            cita = citas[idx]
-
-            fecha_new = st.date_input("Nueva fecha", value=to_date(cita.get("fecha_cita")))
-            hora_new = st.time_input("Nueva hora", value=to_time(cita.get("hora_cita")) or time(9,0))
-            estado_new = st.selectbox("Estado", ESTADOS_VALIDOS,
-                                      index=ESTADOS_VALIDOS.index(cita.get("estado","Agendado")) if cita.get("estado") in ESTADOS_VALIDOS else 0)
-
-            colr1, colr2 = st.columns(2)
-            with colr1:
-                med_label = st.selectbox("Reasignar Médico (opcional)", ["(Mantener)"] + list(map_medico.keys()))
-            with colr2:
-                pac_label = st.selectbox("Reasignar Paciente (opcional)", ["(Mantener)"] + list(map_paciente.keys()))
-
-            payload = {
-                "cita_id": cita["id"],
-                "fecha_cita": fecha_new.strftime("%Y-%m-%d"),
-                "hora_cita": hora_new.strftime("%H:%M:%S"),
-                "estado": estado_new
+            pac_id = map_paciente[sel_pac]["id"]
+            timer_start = st.session_state.get("cita_timer_start")
+            tiempo_segundos = None
+            if timer_start:
+                tiempo_segundos = round(time_mod.time() - timer_start, 2)
+
+            payload_crear = {
+                "medico_id": med_id,
+                "paciente_id": pac_id,
+                "fecha_cita": fecha_cita.strftime("%Y-%m-%d"),
+                "hora_cita": hora_cita.strftime("%H:%M:%S"),
+                "estado": estado,
+                "tiempo_segundos_creacion": tiempo_segundos
             }
-            if med_label != "(Mantener)":
-                payload["medico_id"] = map_medico[med_label]["id"]
-            if pac_label != "(Mantener)":
-                payload["paciente_id"] = map_paciente[pac_label]["id"]
-
-            if st.button("Guardar cambios", type="primary"):
-                res = n8n_api("editar_cita", payload)
-                if res.get("success"):
-                    st.success("✅ Cita actualizada")
-                    st.cache_data.clear()
+
+            res = n8n_api("crear_cita", payload_crear)
+            if res.get("success"):
+                notificar("✅ Cita creada")
+                if tiempo_segundos is not None:
+                    notificar(f"⏱️ Tiempo desde la verificación hasta la creación: {tiempo_segundos} segundos", "info")
                 else:
-                    st.error("❌ No se pudo actualizar la cita")
+                    notificar("⏱️ Tiempo de creación: no disponible", "info")
+                _reset_verificacion()
+                recargar_datos()
+            else:
+                st.error("❌ No se pudo crear la cita")
+
+    if st.session_state.get("cita_firma") and st.session_state.get("cita_firma") != firma_actual:
+        st.info("ℹ️ Cambiaste médico/fecha/hora. Vuelve a verificar disponibilidad.")
+
+@st.fragment
+def seccion_citas_listar():
+    st.subheader("Lista de Citas")
+    colf1, colf2, colf3, colf4 = st.columns(4)
+    with colf1:
+        filtro_estado = st.selectbox("Estado", ["Todos"] + ESTADOS_VALIDOS, index=0, key="citas_list_filtro_estado")
+    with colf2:
+        filtro_medico = st.text_input("Doctor contiene...", key="citas_list_filtro_medico")
+    with colf3:
+        filtro_paciente = st.text_input("Paciente contiene...", key="citas_list_filtro_paciente")
+    with colf4:
+        filtro_fecha = st.date_input("Fecha (opcional)", value=None, key="citas_list_filtro_fecha")
+
+    version = version_datos()
+    df = filtrar_citas(version, filtro_estado, filtro_medico, filtro_paciente, filtro_fecha)
+    if df is None:
+        st.info("No hay citas.")
+        return
 
-    with tabs[3]:
-        st.subheader("Eliminar Cita")
-        citas = n8n_cached("listar_citas", {}) or []
-        if not citas:
-            st.info("No hay citas para eliminar.")
+    st.dataframe(df, use_container_width=True, hide_index=True)
+
+@st.fragment
+def seccion_citas_editar():
+    st.subheader("Editar Cita")
+    version = version_datos()
+    citas, labels = etiquetas_citas(version)
+    if not citas:
+        st.info("No hay citas para editar.")
+        return
+
+    map_medico = opciones_medicos(version)
+    map_paciente = opciones_pacientes(version)
+
+    idx = st.selectbox("Selecciona la cita", list(range(len(citas))), format_func=lambda i: labels[i])
+    cita = citas[idx]
+
+    with st.form("cita_edit_form", border=False):
+        fecha_new = st.date_input("Nueva fecha", value=to_date(cita.get("fecha_cita")))
+        hora_new = st.time_input("Nueva hora", value=to_time(cita.get("hora_cita")) or time(9,0))
+        estado_new = st.selectbox("Estado", ESTADOS_VALIDOS,
+                                  index=ESTADOS_VALIDOS.index(cita.get("estado","Agendado")) if cita.get("estado") in ESTADOS_VALIDOS else 0)
+
+        colr1, colr2 = st.columns(2)
+        with colr1:
+            med_label = st.selectbox("Reasignar Médico (opcional)", ["(Mantener)"] + list(map_medico.keys()))
+        with colr2:
+            pac_label = st.selectbox("Reasignar Paciente (opcional)", ["(Mantener)"] + list(map_paciente.keys()))
+        guardar = st.form_submit_button("Guardar cambios", type="primary")
+
+    if guardar:
+        payload = {
+            "cita_id": cita["id"],
+            "fecha_cita": fecha_new.strftime("%Y-%m-%d"),
+            "hora_cita": hora_new.strftime("%H:%M:%S"),
+            "estado": estado_new
+        }
+        if med_label != "(Mantener)":
+            payload["medico_id"] = map_medico[med_label]["id"]
+        if pac_label != "(Mantener)":
+            payload["paciente_id"] = map_paciente[pac_label]["id"]
+
+        res = n8n_api("editar_cita", payload)
+        if res.get("success"):
+            notificar("✅ Cita actualizada")
+            recargar_datos()
         else:
-            labels = []
-            for c in citas:
-                med = c.get("medico_nombre") or c.get("medico") or ""
-                pac = c.get("paciente_nombre") or c.get("paciente") or ""
-                labels.append(f"[{c['id']}] {c.get('fecha_cita','')} {c.get('hora_cita','')} - {med} / {pac} ({c.get('estado','')})")
-            idx = st.selectbox("Selecciona la cita a eliminar", list(range(len(citas))), format_func=lambda i: labels[i], key="cita_del_sel")
-            cita = citas[idx]
-            st.warning("Esta acción no se puede deshacer.")
-            if st.button("Eliminar Cita", type="secondary"):
-                res = n8n_api("eliminar_cita", {"cita_id": cita["id"]})
-                if res.get("success"):
-                    st.success("🗑️ Cita eliminada")
-                    st.cache_data.clear()
-                else:
-                    st.error("❌ No se pudo eliminar la cita")
+            st.error("❌ No se pudo actualizar la cita")
+
+@st.fragment
+def seccion_citas_eliminar():
+    st.subheader("Eliminar Cita")
+    citas, labels = etiquetas_citas(version_datos())
+    if not citas:
+        st.info("No hay citas para eliminar.")
+        return
+
+    idx = st.selectbox("Selecciona la cita a eliminar", list(range(len(citas))), format_func=lambda i: labels[i], key="cita_del_sel")
+    cita = citas[idx]
+    st.warning("Esta acción no se puede deshacer.")
+    if st.button("Eliminar Cita", type="secondary"):
+        res = n8n_api("eliminar_cita", {"cita_id": cita["id"]})
+        if res.get("success"):
+            notificar("🗑️ Cita eliminada")
+            recargar_datos()
+        else:
+            st.error("❌ No se pudo eliminar la cita")
+
+def pagina_gestion_citas():
+    st.header("📅 Gestión de Citas")
+    mostrar_notificaciones()
+    tabs = st.tabs(["➕ Crear", "📋 Listar", "✏️ Editar", "🗑️ Eliminar"])
+
+    with tabs[0]:
+        seccion_citas_crear()
+    with tabs[1]:
+        seccion_citas_listar()
+    with tabs[2]:
+        seccion_citas_editar()
+    with tabs[3]:
+        seccion_citas_eliminar()
 
 def mostrar_reportes():
     st.header("📊 Reportes y Análisis")
@@ -0,0 +1,147 @@
+"""Prueba de humo de las páginas de gestión con streamlit.testing.
+
+Las llamadas al webhook de n8n se sustituyen por respuestas fijas parcheando
+`requests.post`, de modo que la app se ejecuta completa sin red.
+
+    python -m pytest -q tests
+"""
+from datetime import date, timedelta, time
+from pathlib import Path
+from unittest import mock
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+APP = str(Path(__file__).resolve().parent.parent / "SistemaCitas.py")
+
+MEDICOS = [{"id": 1, "nombre": "Ana Ruiz", "especialidad": "Cardiología"}]
+PACIENTES = [{"id": 7, "nombre": "Luis Pérez", "email": "luis@example.com"}]
+CITAS = [
+    {"id": 3, "fecha_cita": "2030-01-07", "hora_cita": "09:00:00", "estado": "Agendado",
+     "medico_nombre": "Ana Ruiz", "especialidad": "Cardiología", "paciente_nombre": "Luis Pérez"},
+    {"id": 4, "fecha_cita": "fecha-invalida", "hora_cita": "10:00:00", "estado": "Confirmado",
+     "medico_nombre": "Otro Médico", "especialidad": "Pediatría", "paciente_nombre": "Marta Gil"},
+]
+RESPUESTAS = {
+    "listar_medicos": MEDICOS,
+    "listar_pacientes": PACIENTES,
+    "listar_citas": CITAS,
+    "verificar_disponibilidad": {"disponible": "true"},
+}
+
+
+@pytest.fixture
+def llamadas():
+    """Parchea el webhook y devuelve la lista de payloads enviados."""
+    enviados = []
+
+    def fake_post(url, json=None, timeout=None):
+        enviados.append(json)
+        resp = mock.Mock()
+        resp.json.return_value = RESPUESTAS.get(json["accion"], {"success": True})
+        return resp
+
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    with mock.patch("requests.post", side_effect=fake_post):
+        yield enviados
+
+
+def abrir(pagina):
+    at = AppTest.from_file(APP, default_timeout=30)
+    at.run()
+    at.sidebar.selectbox[0].set_value(pagina).run()
+    assert not at.exception
+    return at
+
+
+def boton(at, label):
+    return next(b for b in at.button if b.label == label)
+
+
+def mensajes(elementos):
+    # Streamlit separa el emoji inicial como icono del aviso.
+    return [e.value for e in elementos]
+
+
+def acciones(llamadas, accion):
+    return [p for p in llamadas if p["accion"] == accion]
+
+
+def proximo_lunes():
+    hoy = date.today()
+    return hoy + timedelta(days=7 - hoy.weekday())
+
+
+def test_crear_paciente(llamadas):
+    at = abrir("Gestión de Pacientes")
+    at.text_input(key="pac_crear_nombre").set_value("Nuevo")
+    at.text_input(key="pac_crear_email").set_value("nuevo@example.com")
+    boton(at, "Crear Paciente").click().run()
+
+    assert not at.exception
+    [payload] = acciones(llamadas, "crear_paciente")
+    assert payload["nombre"] == "Nuevo"
+    assert "Paciente creado" in mensajes(at.success)
+
+
+def test_verificar_y_crear_cita(llamadas):
+    at = abrir("Gestión de Citas")
+    assert boton(at, "🩺 Crear Cita").disabled
+
+    at.date_input(key="cita_crear_fecha").set_value(proximo_lunes()).run()
+    at.time_input(key="cita_crear_hora").set_value(time(10, 30)).run()
+    boton(at, "🔍 Verificar Disponibilidad").click().run()
+
+    [verif] = acciones(llamadas, "verificar_disponibilidad")
+    assert verif["medico_id"] == 1
+    assert verif["hora_cita"] == "10:30:00"
+    assert "Horario disponible. Ahora puedes crear la cita." in mensajes(at.success)
+    assert not boton(at, "🩺 Crear Cita").disabled
+
+    boton(at, "🩺 Crear Cita").click().run()
+
+    assert not at.exception
+    [payload] = acciones(llamadas, "crear_cita")
+    assert payload["medico_id"] == 1 and payload["paciente_id"] == 7
+    assert payload["fecha_cita"] == proximo_lunes().strftime("%Y-%m-%d")
+    assert "Cita creada" in mensajes(at.success)
+    assert "Horario disponible. Ahora puedes crear la cita." not in mensajes(at.success)
+
+
+def test_mensaje_de_verificacion_caduca_al_cambiar_hora(llamadas):
+    at = abrir("Gestión de Citas")
+    at.date_input(key="cita_crear_fecha").set_value(proximo_lunes()).run()
+    boton(at, "🔍 Verificar Disponibilidad").click().run()
+    assert at.success
+
+    at.time_input(key="cita_crear_hora").set_value(time(11, 0)).run()
+
+    assert not at.success
+    assert boton(at, "🩺 Crear Cita").disabled
+
+
+def test_filtro_de_citas(llamadas):
+    at = abrir("Gestión de Citas")
+    assert len(at.dataframe[0].value) == 2
+
+    at.text_input(key="citas_list_filtro_medico").set_value("ana").run()
+    assert list(at.dataframe[0].value["id"]) == [3]
+
+    at.text_input(key="citas_list_filtro_medico").set_value("").run()
+    at.date_input(key="citas_list_filtro_fecha").set_value(date(2030, 1, 7)).run()
+    assert not at.exception
+    assert list(at.dataframe[0].value["id"]) == [3]
+
+
+def test_mensaje_de_verificacion_no_sobrevive_al_volver_a_la_pagina(llamadas):
+    at = abrir("Gestión de Citas")
+    at.date_input(key="cita_crear_fecha").set_value(proximo_lunes()).run()
+    boton(at, "🔍 Verificar Disponibilidad").click().run()
+    assert at.success
+
+    at.sidebar.selectbox[0].set_value("Gestión de Pacientes").run()
+    at.sidebar.selectbox[0].set_value("Gestión de Citas").run()
+
+    assert "Horario disponible. Ahora puedes crear la cita." not in mensajes(at.success)